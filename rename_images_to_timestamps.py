@@ -1,60 +1,265 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import ctypes
+import errno
 import ffmpeg
+import hashlib
+import logging
+import math
+import multiprocessing
 import os
 from PIL import Image
+import re
+import stat
+import sys
+import time
 
-imgFormats = ['png', 'jpg', 'jpeg']
-videoFormats = ['m4v', 'mov', 'mp4']
+imgFormats = {'png', 'jpg', 'jpeg'}
+videoFormats = {'m4v', 'mov', 'mp4'}
+multimediaFormats = imgFormats | videoFormats
 
-def date_img(path: str) -> str:
-    return Image.open(path)._getexif()[36867]
+# Read size for streamed hashing, keeps memory bounded for large videos
+HASH_CHUNK_SIZE = 1 << 20
+FINGERPRINT_SIZE = 4096
 
-def date_vid(path: str) -> str:
-    return ffmpeg.probe(path)["streams"][1]["tags"]["creation_time"].replace(
-        'T', ' '
-        ).replace(
-            '-', ':'
-            ).split('.')[0]
+# (path, size, mtime) -> digest of the first FINGERPRINT_SIZE bytes
+_fingerprint_cache: dict[tuple[str, int, float], bytes] = {}
+# (path, size, mtime) -> digest of the whole file
+_digest_cache: dict[tuple[str, int, float], bytes] = {}
 
-def endswith_one_of_extensions(file: str, extensions: list[str]) -> bool:
-    for ext in extensions:
-        if file.endswith(ext):
-            return True
-    return False
+logger = logging.getLogger(__name__)
+
+# Linux renameat2(2) constants, see <fcntl.h> and <linux/fs.h>
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+
+def _load_renameat2():
+    if not sys.platform.startswith('linux'):
+        return None
+    renameat2 = getattr(ctypes.CDLL(None, use_errno=True), 'renameat2', None)
+    if renameat2 is not None:
+        renameat2.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+        renameat2.restype = ctypes.c_int
+    return renameat2
+
+_renameat2 = _load_renameat2()
+
+# Duplicate checks hash the source and the existing target, one thread each
+HASH_WORKERS = 2
+
+# Below this many files spawning worker processes costs more than it saves
+PARALLEL_THRESHOLD = 64
+
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 36867
+EMPTY_TIMESTAMP = '0000:00:00 00:00:00'
+EXIF_TIMESTAMP_PATTERN = re.compile(r'\d{4}:\d\d:\d\d \d\d:\d\d:\d\d')
+EXIF_TIME_FORMAT = '%Y:%m:%d %H:%M:%S'
+
+def date_img(path: str) -> str | None:
+    # Only the Exif sub-IFD is decoded, GPS/Interop/MakerNote blocks are skipped
+    try:
+        with Image.open(path) as img:
+            return img.getexif().get_ifd(EXIF_IFD).get(DATE_TIME_ORIGINAL)
+    except OSError:
+        # Unidentified, truncated or unreadable image, handled like a missing date
+        return None
+
+def date_vid(path: str) -> str | None:
+    # ISO 8601 'YYYY-MM-DDTHH:MM:SS[.ffffff]Z' sliced into EXIF 'YYYY:MM:DD HH:MM:SS'
+    try:
+        creation_time = ffmpeg.probe(path)["streams"][1]["tags"]["creation_time"]
+    except (ffmpeg.Error, IndexError, KeyError):
+        return None
+    return f'{creation_time[0:4]}:{creation_time[5:7]}:{creation_time[8:10]} {creation_time[11:19]}'
+
+def date_modified(path: str) -> str:
+    return time.strftime(EXIF_TIME_FORMAT, time.localtime(os.stat(path).st_mtime))
+
+def date_created(path: str) -> str:
+    # st_birthtime exists on macOS, BSD and Windows (Python 3.12+), parse_args rejects the rest
+    return time.strftime(EXIF_TIME_FORMAT, time.localtime(os.stat(path).st_birthtime))
+
+# --missing-date choice -> (description for the log, fallback date reader)
+FALLBACK_DATES = {
+    'modify': ('modification', date_modified),
+    'create': ('creation', date_created),
+    }
+
+def date_of(path: str, extension: str) -> str | None:
+    if extension.lower() in videoFormats:
+        # Working for Redmi Note 8 Pro, maybe other devices
+        return date_vid(path)
+    return date_img(path)
+
+def read_dates(paths: list[str], extensions: list[str]) -> list[str | None]:
+    if len(paths) < PARALLEL_THRESHOLD:
+        return list(map(date_of, paths, extensions))
+    processes = os.cpu_count() or 1
+    with multiprocessing.Pool(processes) as pool:
+        return pool.starmap(
+            date_of, zip(paths, extensions), chunksize=math.ceil(len(paths) / processes)
+            )
+
+def list_files(path: str = '.') -> tuple[list[str], list[str]]:
+    filenames = []
+    extensions = []
+    with os.scandir(path) as it:
+        for entry in it:
+            dot = entry.name.rfind('.')
+            extension = entry.name[dot + 1:]
+            if (
+                    dot >= 0 and extension.lower() in multimediaFormats
+                    and entry.is_file(follow_symlinks=False)
+                    ):
+                filenames.append(entry.name)
+                extensions.append(extension)
+    return filenames, extensions
 
 def timestamp_filename(timestamp: str, extension: str) -> str:
-    return timestamp.replace(':','').replace(' ', '_') + '.' + extension
+    # EXIF 'YYYY:MM:DD HH:MM:SS' -> 'YYYYMMDD_HHMMSS.ext'
+    return (
+        f'{timestamp[0:4]}{timestamp[5:7]}{timestamp[8:10]}_'
+        f'{timestamp[11:13]}{timestamp[14:16]}{timestamp[17:19]}.{extension}'
+        )
+
+def is_valid_timestamp(timestamp: str | None) -> bool:
+    # Only the fixed slices are used, so trailing NUL padding is fine but placeholders are not
+    if not isinstance(timestamp, str):
+        return False
+    head = timestamp[:19]
+    return EXIF_TIMESTAMP_PATTERN.fullmatch(head) is not None and head != EMPTY_TIMESTAMP
+
+def has_timestamp_name(filename: str, new_filename: str) -> bool:
+    # The exact name or one of its ' (n)' collision variants from an earlier run
+    if filename == new_filename:
+        return True
+    stem, extension = os.path.splitext(new_filename)
+    return re.fullmatch(re.escape(stem) + r' \(\d+\)' + re.escape(extension), filename) is not None
+
+def quick_fingerprint(path: str) -> tuple[int, bytes]:
+    file_stat = os.stat(path)
+    key = (path, file_stat.st_size, file_stat.st_mtime)
+    digest = _fingerprint_cache.get(key)
+    if digest is None:
+        with open(path, 'rb') as file:
+            digest = hashlib.blake2b(file.read(FINGERPRINT_SIZE), digest_size=16).digest()
+        _fingerprint_cache[key] = digest
+    return file_stat.st_size, digest
+
+def file_digest(path: str) -> bytes:
+    file_stat = os.stat(path)
+    key = (path, file_stat.st_size, file_stat.st_mtime)
+    digest = _digest_cache.get(key)
+    if digest is None:
+        hasher = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb', buffering=0) as file:
+            for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        digest = hasher.digest()
+        _digest_cache[key] = digest
+    return digest
 
-def change_name_until_success(old_filename: str, new_filename: str):
-    print('Changing name from: ' + old_filename + ' to: ' + new_filename)
+def files_are_identical(path_a: str, path_b: str, executor: ThreadPoolExecutor) -> bool:
+    if quick_fingerprint(path_a) != quick_fingerprint(path_b):
+        return False
+    # hashlib releases the GIL on large buffers, so both files hash concurrently
+    digest_a, digest_b = executor.map(file_digest, (path_a, path_b))
+    return digest_a == digest_b
+
+def rename_no_replace(old_filename: str, new_filename: str):
+    # One atomic syscall that both checks for and refuses to replace an existing target
+    if _renameat2 is not None:
+        if _renameat2(
+                AT_FDCWD, os.fsencode(old_filename), AT_FDCWD, os.fsencode(new_filename), RENAME_NOREPLACE
+                ) == 0:
+            return
+        error = ctypes.get_errno()
+        # Kernel or filesystem without RENAME_NOREPLACE support, use the portable path
+        if error not in (errno.ENOSYS, errno.EINVAL):
+            raise OSError(error, os.strerror(error), old_filename, None, new_filename)
+    # os.rename silently replaces an existing target on POSIX, so check first
+    if os.path.lexists(new_filename):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), new_filename)
+    os.rename(old_filename, new_filename)
+
+def change_name_until_success(old_filename: str, new_filename: str, executor: ThreadPoolExecutor):
+    logger.info('Changing name from: %s to: %s', old_filename, new_filename)
+    stem, extension = os.path.splitext(new_filename)
     i = 1
     while True:
+        candidate = new_filename if i == 1 else f'{stem} ({i}){extension}'
+        if candidate == old_filename:
+            break
         try:
-            if i == 1:
-                os.rename(old_filename, new_filename)
-                break
-            else:
-                os.rename(
-                    old_filename, 
-                    new_filename.split('.')[0] + 
-                    ' (' + str(i) + ').' + 
-                    new_filename.split('.')[1]
-                    )
-                break
+            rename_no_replace(old_filename, candidate)
+            break
+        except FileNotFoundError:
+            logger.warning('File disappeared before renaming: %s', old_filename)
+            break
         except FileExistsError:
-            i += 1
+            pass
+        # Only a separate regular file can be a duplicate, never a symlink, directory or hard link
+        if (
+                stat.S_ISREG(os.lstat(candidate).st_mode)
+                and not os.path.samefile(old_filename, candidate)
+                and files_are_identical(old_filename, candidate, executor)
+                ):
+            logger.info('Removing duplicate of %s: %s', candidate, old_filename)
+            os.remove(old_filename)
+            break
+        i += 1
+
+def rename_files(missing_date: str):
+    filenames, extensions = list_files()
+    timestamps = read_dates(filenames, extensions)
+    has_date = [is_valid_timestamp(timestamp) for timestamp in timestamps]
+    for index, (filename, valid) in enumerate(zip(filenames, has_date)):
+        if valid:
+            continue
+        if missing_date in FALLBACK_DATES:
+            description, fallback_date = FALLBACK_DATES[missing_date]
+            logger.warning('No capture date found, using %s date: %s', description, filename)
+            timestamps[index] = fallback_date(filename)
+            has_date[index] = True
+        else:
+            logger.warning('No capture date found, skipping: %s', filename)
+    renames = [
+        (old_filename, new_filename)
+        for old_filename, extension, timestamp, valid in zip(filenames, extensions, timestamps, has_date)
+        if valid
+        # Files already carrying their timestamp name need no syscalls at all
+        if not has_timestamp_name(old_filename, new_filename := timestamp_filename(timestamp, extension))
+        ]
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+        for old_filename, new_filename in renames:
+            change_name_until_success(old_filename, new_filename, executor)
+
+def setup_logging():
+    # Output is just the message, skip collecting thread/process details for every record
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Rename images and videos in the current directory to their capture timestamps.'
+        )
+    parser.add_argument(
+        '--missing-date', choices=['skip', *FALLBACK_DATES], default='skip',
+        help='what to do with files that have no capture date metadata (default: skip)'
+        )
+    args = parser.parse_args()
+    if args.missing_date == 'create' and not hasattr(os.stat('.'), 'st_birthtime'):
+        parser.error('--missing-date create needs file creation times, which this platform does not record')
+    return args
 
 def main():
-    for old_filename in os.listdir():
-        if not old_filename.endswith('.py'):
-            new_filename = ''
-            extension = old_filename.split('.')[-1]
-            if endswith_one_of_extensions(old_filename.lower(), videoFormats):
-                # Working for Redmi Note 8 Pro, maybe other devices
-                new_filename = timestamp_filename(date_vid(old_filename), extension)
-            if endswith_one_of_extensions(old_filename.lower(), imgFormats):
-                new_filename = timestamp_filename(date_img(old_filename), extension)
-            change_name_until_success(old_filename, new_filename)
-            
+    args = parse_args()
+    setup_logging()
+    rename_files(args.missing_date)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
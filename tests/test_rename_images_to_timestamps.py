@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+
+import pytest
+
+import rename_images_to_timestamps as renamer
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield executor
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def write(path: str, content: bytes):
+    with open(path, 'wb') as file:
+        file.write(content)
+
+
+def read(path: str) -> bytes:
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def test_identical_duplicate_is_removed(executor):
+    write('20200101_120000.jpg', b'photo')
+    write('IMG_1.jpg', b'photo')
+    renamer.change_name_until_success('IMG_1.jpg', '20200101_120000.jpg', executor)
+    assert sorted(os.listdir()) == ['20200101_120000.jpg']
+    assert read('20200101_120000.jpg') == b'photo'
+
+
+def test_different_content_gets_suffix(executor):
+    write('20200101_120000.jpg', b'first')
+    write('IMG_2.jpg', b'second')
+    renamer.change_name_until_success('IMG_2.jpg', '20200101_120000.jpg', executor)
+    assert sorted(os.listdir()) == ['20200101_120000 (2).jpg', '20200101_120000.jpg']
+    assert read('20200101_120000.jpg') == b'first'
+    assert read('20200101_120000 (2).jpg') == b'second'
+
+
+def test_symlink_target_is_not_a_duplicate(executor):
+    write('IMG_1.jpg', b'photo')
+    os.symlink('IMG_1.jpg', '20200101_120000.jpg')
+    renamer.change_name_until_success('IMG_1.jpg', '20200101_120000.jpg', executor)
+    assert read('20200101_120000 (2).jpg') == b'photo'
+    assert os.path.islink('20200101_120000.jpg')
+
+
+def test_hard_link_target_is_not_a_duplicate(executor):
+    write('IMG_1.jpg', b'photo')
+    os.link('IMG_1.jpg', '20200101_120000.jpg')
+    renamer.change_name_until_success('IMG_1.jpg', '20200101_120000.jpg', executor)
+    assert sorted(os.listdir()) == ['20200101_120000 (2).jpg', '20200101_120000.jpg']
+    assert read('20200101_120000 (2).jpg') == b'photo'
+
+
+def test_directory_target_is_not_a_duplicate(executor):
+    os.mkdir('20200101_120000.jpg')
+    write('IMG_1.jpg', b'photo')
+    renamer.change_name_until_success('IMG_1.jpg', '20200101_120000.jpg', executor)
+    assert os.path.isdir('20200101_120000.jpg')
+    assert read('20200101_120000 (2).jpg') == b'photo'
+
+
+def test_fallback_rename_refuses_to_overwrite(executor, monkeypatch):
+    monkeypatch.setattr(renamer, '_renameat2', None)
+    write('20200101_120000.jpg', b'first')
+    write('IMG_2.jpg', b'second')
+    with pytest.raises(FileExistsError):
+        renamer.rename_no_replace('IMG_2.jpg', '20200101_120000.jpg')
+    assert read('20200101_120000.jpg') == b'first'
+    renamer.change_name_until_success('IMG_2.jpg', '20200101_120000.jpg', executor)
+    assert read('20200101_120000.jpg') == b'first'
+    assert read('20200101_120000 (2).jpg') == b'second'
+
+
+def test_rerun_leaves_suffixed_names_alone(monkeypatch, caplog):
+    for name in ('20200101_120000.jpg', '20200101_120000 (2).jpg', 'IMG_3.jpg'):
+        write(name, name.encode())
+    monkeypatch.setattr(
+        renamer, 'read_dates', lambda paths, extensions: ['2020:01:01 12:00:00'] * len(paths)
+        )
+    with caplog.at_level('INFO'):
+        renamer.rename_files('skip')
+    assert [
+        record.getMessage() for record in caplog.records
+        ] == ['Changing name from: IMG_3.jpg to: 20200101_120000.jpg']
+    assert read('20200101_120000 (2).jpg') == b'20200101_120000 (2).jpg'
+    assert read('20200101_120000 (3).jpg') == b'IMG_3.jpg'
+
+
+@pytest.mark.parametrize('timestamp, valid', [
+    ('2020:01:01 12:00:00', True),
+    ('2020:01:01 12:00:00\x00', True),
+    (None, False),
+    ('', False),
+    ('0000:00:00 00:00:00', False),
+    ('0000:00:00 00:00:00\x00', False),
+    ('    :  :     :  :  ', False),
+    ('2020:01:01', False),
+    ])
+def test_is_valid_timestamp(timestamp, valid):
+    assert renamer.is_valid_timestamp(timestamp) is valid
+
+
+@pytest.mark.skipif(hasattr(os.stat('.'), 'st_birthtime'), reason='platform records creation times')
+def test_create_policy_is_rejected_without_creation_times(monkeypatch, capsys):
+    monkeypatch.setattr('sys.argv', ['rename_images_to_timestamps.py', '--missing-date', 'create'])
+    with pytest.raises(SystemExit):
+        renamer.parse_args()
+    assert 'creation times' in capsys.readouterr().err